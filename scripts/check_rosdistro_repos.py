@@ -72,7 +72,9 @@ def clone_hg_repo(url, version, path):
 
 
 def checkout_svn_repo(url, version, path):
-    cmd = ['svn', '--non-interactive', '--trust-server-cert', 'checkout', url, '-q']
+    # only a snapshot of the tree is needed to look for packages
+    # so export it instead of creating a full working copy
+    cmd = ['svn', '--non-interactive', '--trust-server-cert', 'export', url, '-q']
     if version:
         cmd.extend(['-r', version])
     try:
@@ -81,6 +83,19 @@ def checkout_svn_repo(url, version, path):
         raise RuntimeError('not a valid svn repo url')
 
 
+check_repo_functions = {
+    'git': check_git_repo,
+    'hg': check_hg_repo,
+    'svn': check_svn_repo,
+}
+
+clone_repo_functions = {
+    'git': clone_git_repo,
+    'hg': clone_hg_repo,
+    'svn': checkout_svn_repo,
+}
+
+
 def main(repo_type, rosdistro_name, check_for_wet_packages=False):
     index = get_index(get_index_url())
     try:
@@ -99,17 +114,13 @@ def main(repo_type, rosdistro_name, check_for_wet_packages=False):
             repo = repo.source_repository
         if not repo:
             continue
+        check_repo = check_repo_functions.get(repo.type)
+        if check_repo is None:
+            print()
+            print("Unknown type '%s' for repository '%s'" % (repo.type, repo.name), file=sys.stderr)
+            continue
         try:
-            if (repo.type == 'git'):
-                check_git_repo(repo.url, repo.version)
-            elif (repo.type == 'hg'):
-                check_hg_repo(repo.url, repo.version)
-            elif (repo.type == 'svn'):
-                check_svn_repo(repo.url, repo.version)
-            else:
-                print()
-                print("Unknown type '%s' for repository '%s'" % (repo.type, repo.name), file=sys.stderr)
-                continue
+            check_repo(repo.url, repo.version)
         except RuntimeError as e:
             print()
             print("Could not fetch repository '%s': %s (%s) [%s]" % (repo.name, repo.url, repo.version, e), file=sys.stderr)
@@ -118,12 +129,7 @@ def main(repo_type, rosdistro_name, check_for_wet_packages=False):
         if check_for_wet_packages:
             path = tempfile.mkdtemp()
             try:
-                if repo.type == 'git':
-                    clone_git_repo(repo.url, repo.version, path)
-                elif repo.type == 'hg':
-                    clone_hg_repo(repo.url, repo.version, path)
-                elif repo.type == 'svn':
-                    checkout_svn_repo(repo.url, repo.version, path)
+                clone_repo_functions[repo.type](repo.url, repo.version, path)
             except RuntimeError as e:
                 print()
                 print("Could not clone repository '%s': %s (%s) [%s]" % (repo.name, repo.url, repo.version, e), file=sys.stderr)
@@ -2,28 +2,96 @@
 
 import yaml
 import argparse
+import collections
+import errno
+import functools
+import hashlib
 import re
 import io
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
 
-dont_bracket = ['uri', 'md5sum']
+try:
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+
+try:
+    from sys import intern
+except ImportError:
+    # Python 2 provides intern as a builtin
+    pass
+
+
+class InterningLoader(SafeLoader):
+    """Safe loader sharing a single object for every repeated string.
+
+    Mappings are loaded with their keys already sorted, which is the order
+    they are emitted in.
+    """
+
+
+def construct_interned_str(loader, node):
+    value = loader.construct_yaml_str(node)
+    # Python 2 can only intern byte strings
+    if isinstance(value, str):
+        value = intern(value)
+    return value
+
+
+def construct_sorted_map(loader, node):
+    mapping = loader.construct_mapping(node)
+    return collections.OrderedDict((k, mapping[k]) for k in sorted(mapping))
+
+
+InterningLoader.add_constructor('tag:yaml.org,2002:str', construct_interned_str)
+InterningLoader.add_constructor('tag:yaml.org,2002:map', construct_sorted_map)
+
+dont_bracket = frozenset(['uri', 'md5sum'])
+
+pads = ['  ' * i for i in range(16)]
+
+quote_pattern = re.compile(r'\{a: (.*)\}\n')
+# strings which the yaml emitter always writes as plain scalars
+plain_pattern = re.compile(r'^[A-Za-z_][A-Za-z0-9_\-.+]*$')
+# words which would be resolved as booleans or null if left unquoted
+reserved_words = frozenset(['true', 'false', 'yes', 'no', 'on', 'off', 'null'])
+# the same scalars (package names, installers) repeat throughout the tree
+quoted_scalars = {}
+quoted_keys = {}
 
 def paddify(s, l):
     a = s.split('\n')
-    buf = ''
     pad = '  ' * l
-    for i, r in enumerate(a[:-1]):
-        buf += "%s%s\n" % (pad, r)
-    return buf
+    return ''.join(pad + r + '\n' for r in a[:-1])
 
 def quote_if_necessary(s):
     if type(s) is list:
         return [quote_if_necessary(a) for a in s]
-    return re.search('{a: (.*)}\n', yaml.dump({'a': s})).group(1)
+    if isinstance(s, str) and plain_pattern.match(s) and s.lower() not in reserved_words:
+        return s
+    key = (type(s), s)
+    try:
+        return quoted_scalars[key]
+    except KeyError:
+        pass
+    quoted = quote_pattern.search(yaml.dump({'a': s}, Dumper=SafeDumper, default_flow_style=True)).group(1)
+    quoted_scalars[key] = quoted
+    return quoted
 
-def prn(n, nm, lvl):
+def quote_key(nm):
+    key = (type(nm), nm)
+    try:
+        return quoted_keys[key]
+    except KeyError:
+        pass
+    quoted = nm
     if nm == '*':
         # quote wildcard keys
-        nm = "'*'"
+        quoted = "'*'"
     else:
         # quote numeric keys
         try:
@@ -32,37 +100,163 @@ def prn(n, nm, lvl):
             pass
         else:
             if str(nm_int) == nm:
-                nm = "'%d'" % nm_int
-    pad = '  ' * lvl
-    if isinstance(n, list):
-        return "%s%s: [%s]\n" % (pad, nm, ', '.join(quote_if_necessary(n)))
-    elif n is None:
-        return "%s%s:\n" % (pad, nm)
-    elif isinstance(n, str):
-        if len(n.split('\n')) > 1:
-            return "%s%s: |\n%s" % (pad, nm, paddify(n, lvl+1))
+                quoted = "'%d'" % nm_int
+    quoted_keys[key] = quoted
+    return quoted
+
+def prn(n, nm, lvl, out=None):
+    if out is None:
+        out = []
+        prn(n, nm, lvl, out)
+        return ''.join(out)
+    # walk the tree with an explicit stack, children are pushed in reverse
+    # order so that they are emitted in the order of the (sorted) mapping
+    stack = [(n, nm, lvl)]
+    # bind the names used per node to locals for the loop below
+    pop = stack.pop
+    extend = stack.extend
+    append = out.append
+    quote = quote_if_necessary
+    _quote_key = quote_key
+    _isinstance = isinstance
+    _list = list
+    _str = str
+    _pads = pads
+    max_pad = len(pads)
+    plain_match = plain_pattern.match
+    reserved = reserved_words
+    while stack:
+        n, nm, lvl = pop()
+        nm = _quote_key(nm)
+        pad = _pads[lvl] if lvl < max_pad else '  ' * lvl
+        if _isinstance(n, _list):
+            # lists of package names usually need no quoting at all
+            if not all(_isinstance(e, _str) and plain_match(e) and e.lower() not in reserved for e in n):
+                n = quote(n)
+            append("%s%s: [%s]\n" % (pad, nm, ', '.join(n)))
+        elif n is None:
+            append("%s%s:\n" % (pad, nm))
+        elif _isinstance(n, _str):
+            if '\n' in n:
+                append("%s%s: |\n%s" % (pad, nm, paddify(n, lvl+1)))
+            elif nm in dont_bracket:
+                append("%s%s: %s\n" % (pad, nm, quote(n)))
+            else:
+                items = n.split()
+                if not all(plain_match(e) and e.lower() not in reserved for e in items):
+                    items = quote(items)
+                append("%s%s: [%s]\n" % (pad, nm, ', '.join(items)))
         else:
-            if nm in dont_bracket:
-                return "%s%s: %s\n" % (pad, nm, quote_if_necessary(n))
-            return "%s%s: [%s]\n" % (pad, nm, ', '.join(quote_if_necessary(n.split())))
-    buf = "%s%s:\n" % (pad, nm)
-    for a in sorted(n.keys()):
-        buf += prn(n[a], a, lvl+1)
-    return buf
+            append("%s%s:\n" % (pad, nm))
+            extend((n[a], a, lvl+1) for a in reversed(n))
+
+
+def get_cache_file(data):
+    """Return the cache path for the cleaned output of the given input bytes."""
+    h = hashlib.sha256(data)
+    # invalidate cached results whenever this script changes
+    with open(os.path.abspath(__file__), 'rb') as f:
+        h.update(f.read())
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'rosdistro', 'clean_rosdep_yaml', h.hexdigest() + '.yaml')
+
+
+def store_in_cache(path, cache_file):
+    try:
+        os.makedirs(os.path.dirname(cache_file))
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            return
+    # copy to a temporary name first so that readers never see a partial entry
+    try:
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix='.tmp')
+    except (IOError, OSError):
+        return
+    os.close(fd)
+    try:
+        shutil.copyfile(path, tmp_file)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError):
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+
+
+def replace_file(outfile, write):
+    """Call write with a temporary file which replaces outfile once write succeeds.
+
+    This leaves outfile untouched if write fails, even if it is also the input.
+    """
+    outdir = os.path.dirname(os.path.abspath(outfile))
+    fd, tmp_file = tempfile.mkstemp(dir=outdir, suffix='.tmp')
+    try:
+        with io.open(fd, 'wb', buffering=1 << 20) as f:
+            write(f)
+        # mkstemp creates files only readable by the owner
+        try:
+            shutil.copymode(outfile, tmp_file)
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_file, 0o666 & ~umask)
+        os.rename(tmp_file, outfile)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+def clean_rosdep_yaml(infile, outfile, use_cache=False):
+    with open(infile, 'rb') as f:
+        data = f.read()
+
+    cache_file = get_cache_file(data) if use_cache else None
+    if cache_file and os.path.isfile(cache_file):
+        with open(cache_file, 'rb') as cached:
+            replace_file(outfile, lambda f: shutil.copyfileobj(cached, f))
+        return
+
+    iny = yaml.load(data, Loader=InterningLoader)
+
+    # write each top level entry as soon as it is rendered
+    def write(f):
+        for a in iny:
+            f.write(prn(iny[a], a, 0).encode('utf-8'))
+    replace_file(outfile, write)
+
+    if cache_file:
+        store_in_cache(outfile, cache_file)
+
+
+def process_one(paths, use_cache=False):
+    infile, outfile = paths
+    clean_rosdep_yaml(infile, outfile, use_cache=use_cache)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Cleans a rosdep YAML file to a correct format')
-    parser.add_argument('infile', help='input rosdep YAML file')
-    parser.add_argument('outfile', help='output YAML file to be written')
+    parser.add_argument('infile', nargs='?', help='input rosdep YAML file')
+    parser.add_argument('outfile', nargs='?', help='output YAML file to be written')
+    parser.add_argument('--cache', action='store_true', help='reuse and store previously cleaned output')
+    parser.add_argument('--batch', action='store_true', help='read rosdep YAML files from stdin, one per line, and clean them in place')
+    parser.add_argument('--jobs', type=int, default=1, help='number of files to clean in parallel (default: 1)')
     args = parser.parse_args()
 
-    with open(args.infile) as f:
-        iny = yaml.load(f.read())
-
-    buf = ''
-    for a in sorted(iny):
-        buf += prn(iny[a], a, 0)
+    if args.batch:
+        files = [(line.strip(), line.strip()) for line in sys.stdin if line.strip()]
+    elif args.infile and args.outfile:
+        files = [(args.infile, args.outfile)]
+    else:
+        parser.error('either infile and outfile or --batch are required')
 
-    with io.open(args.outfile, 'wb') as f:
-        f.write(buf.encode('utf-8'))
+    clean_one = functools.partial(process_one, use_cache=args.cache)
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs)
+        try:
+            pool.map(clean_one, files)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for paths in files:
+            clean_one(paths)
@@ -3,32 +3,93 @@
 from __future__ import print_function
 
 import argparse
+import functools
+import json
+import multiprocessing
 import sys
 import yaml
 
+try:
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
 
-def sort_yaml(yaml_file):
-    data = yaml.load(open(yaml_file, 'r'))
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+def sort_yaml(yaml_file, output_format='yaml'):
+    with open(yaml_file, 'rb') as f:
+        data = yaml.load(f, Loader=SafeLoader)
     if 'version' in data:
-        print('This script does not support the new rosdistro yaml files', file=sys.stderr)
-        sys.exit(1)
+        raise RuntimeError('This script does not support the new rosdistro yaml files')
     sort_yaml_data(data)
+    # serialize before opening the file so that errors leave it untouched
+    if output_format == 'json':
+        check_json_keys(data)
+        # JSON is a subset of YAML so the file stays loadable
+        content = json.dumps(data, indent=2, separators=(',', ': '), sort_keys=True) + '\n'
+    else:
+        content = yaml.dump(data, Dumper=SafeDumper, default_flow_style=False)
     with open(yaml_file, 'w') as out_file:
-        yaml.dump(data, out_file, default_flow_style=False)
+        out_file.write(content)
+
+
+def check_json_keys(data):
+    # JSON would silently turn other keys like 10 or true into strings
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            for key in node:
+                if not isinstance(key, string_types):
+                    raise ValueError('Can not convert non-string key %r to JSON' % (key,))
+            stack.extend(node.values())
 
 
 def sort_yaml_data(data):
-    # sort lists
-    if isinstance(data, list):
-        data.sort()
-    # recurse into each value of a dict
-    elif isinstance(data, dict):
-        for k in data:
-            sort_yaml_data(data[k])
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        # sort lists
+        if isinstance(node, list):
+            node.sort()
+        # descend into each value of a dict
+        elif isinstance(node, dict):
+            stack.extend(node.values())
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Sort the .yaml file in place.')
-    parser.add_argument('yaml_file', help='The .yaml file to update')
+    parser.add_argument('yaml_file', nargs='?', help='The .yaml file to update')
+    parser.add_argument('--format', choices=['yaml', 'json'], default='yaml', help='The format to write the sorted data in (default: yaml)')
+    parser.add_argument('--batch', action='store_true', help='Read the .yaml files to update from stdin, one per line')
+    parser.add_argument('--jobs', type=int, default=1, help='The number of files to process in parallel (default: 1)')
     args = parser.parse_args()
-    sort_yaml(args.yaml_file)
+
+    if args.batch:
+        yaml_files = [line.strip() for line in sys.stdin if line.strip()]
+    elif args.yaml_file:
+        yaml_files = [args.yaml_file]
+    else:
+        parser.error('either a yaml_file or --batch is required')
+
+    process_one = functools.partial(sort_yaml, output_format=args.format)
+    try:
+        if args.jobs > 1:
+            pool = multiprocessing.Pool(args.jobs)
+            try:
+                pool.map(process_one, yaml_files)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for yaml_file in yaml_files:
+                process_one(yaml_file)
+    except (RuntimeError, TypeError, ValueError) as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
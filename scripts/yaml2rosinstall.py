@@ -2,45 +2,71 @@
 
 from __future__ import print_function
 import argparse
+import multiprocessing
 import os
 import sys
 import yaml
 
+try:
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader
+
 
 def convert_yaml_to_rosinstall(yaml_file, rosinstall_file):
-    data = yaml.load(open(yaml_file, 'r'))
+    with open(yaml_file, 'rb') as f:
+        data = yaml.load(f, Loader=SafeLoader)
     data = convert_yaml_data_to_rosinstall_data(data)
     with open(rosinstall_file, 'w') as out_file:
-        yaml.dump(data, out_file, default_flow_style=False)
+        yaml.dump(data, out_file, Dumper=SafeDumper, default_flow_style=False)
 
 
 def convert_yaml_data_to_rosinstall_data(data):
     rosinstall_data = []
-    for name in sorted(data['repositories'].keys()):
-        values = data['repositories'][name]
-        repo = {}
-        repo['local-name'] = name
-        repo['uri'] = values['url']
+    for name, values in sorted(data['repositories'].items()):
+        repo = {'local-name': name, 'uri': values['url']}
         if 'version' in values:
             repo['version'] = values['version']
         # fallback type is git for gbp repositories
-        vcs_type = values['type'] if 'type' in values else 'git'
-        rosinstall_data.append({vcs_type: repo})
+        rosinstall_data.append({values.get('type', 'git'): repo})
     return rosinstall_data
 
 
+def process_one(paths):
+    convert_yaml_to_rosinstall(*paths)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Convert a .yaml file into a .rosinstall file.')
-    parser.add_argument('yaml_file', help='The .yaml file to convert')
+    parser.add_argument('yaml_file', nargs='?', help='The .yaml file to convert')
     parser.add_argument('rosinstall_file', nargs='?', help='The generated .rosinstall file (default: same name as .yaml file except extension)')
+    parser.add_argument('--batch', action='store_true', help='Read the .yaml files to convert from stdin, one per line, and write each .rosinstall file next to it')
+    parser.add_argument('--jobs', type=int, default=1, help='The number of files to convert in parallel (default: 1)')
     args = parser.parse_args()
 
-    if args.rosinstall_file is None:
-        path_without_ext, _ = os.path.splitext(args.yaml_file)
-        args.rosinstall_file = path_without_ext + '.rosinstall'
+    if args.batch:
+        files = [(line.strip(), None) for line in sys.stdin if line.strip()]
+    elif args.yaml_file:
+        files = [(args.yaml_file, args.rosinstall_file)]
+    else:
+        parser.error('either a yaml_file or --batch is required')
+
+    for i, (yaml_file, rosinstall_file) in enumerate(files):
+        if rosinstall_file is None:
+            path_without_ext, _ = os.path.splitext(yaml_file)
+            files[i] = (yaml_file, path_without_ext + '.rosinstall')
 
     try:
-        convert_yaml_to_rosinstall(args.yaml_file, args.rosinstall_file)
+        if args.jobs > 1:
+            pool = multiprocessing.Pool(args.jobs)
+            try:
+                pool.map(process_one, files)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for paths in files:
+                process_one(paths)
     except Exception as e:
         print(str(e), file=sys.stderr)
         exit(1)
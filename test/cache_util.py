@@ -0,0 +1,37 @@
+import json
+import os
+import tempfile
+
+
+def get_cache_path(*names):
+    """Return the path of a file in the rosdistro cache directory."""
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'rosdistro', *names)
+
+
+def load_json(path):
+    """Return the data of a JSON cache file, or an empty dict if it can not be read."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def save_json(path, data):
+    """Write a JSON cache file only readable by its owner.
+
+    The data is written to a temporary file which replaces the cache file
+    once it is complete, so an interrupted write never truncates it.
+    """
+    cache_dir = os.path.dirname(path)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmp_file, path)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
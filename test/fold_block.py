@@ -1,30 +1,55 @@
+import itertools
 import os
+import sys
 
-next_block_id = 1
+block_ids = itertools.count(1)
 
+on_travis = os.environ.get('TRAVIS') == 'true'
 
-class Fold(object):
+
+class _TravisFold(object):
 
     def __init__(self):
-        global next_block_id
-        self.block_id = next_block_id
-        next_block_id += 1
+        self.block_id = next(block_ids)
+        self.block_name = 'block%d' % self.block_id
+        self._start_line = 'travis_fold:start:%s\n' % self.block_name
+        self._end_line = 'travis_fold:end:%s\n' % self.block_name
+
+    def get_message(self, msg=''):
+        if msg:
+            msg += ', '
+        msg += "see folded block '%s' above for details" % self.block_name
+        return msg
+
+    def get_block_name(self):
+        return self.block_name
+
+    def __enter__(self):
+        sys.stdout.write(self._start_line)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        sys.stdout.write(self._end_line)
+
+
+class _NoopFold(object):
+    """Fold used outside of Travis where no fold markers are printed."""
+
+    def __init__(self):
+        self.block_id = next(block_ids)
 
     def get_message(self, msg=''):
-        if os.environ.get('TRAVIS') == 'true':
-            if msg:
-                msg += ', '
-            msg += "see folded block '%s' above for details" % self.get_block_name()
         return msg
 
     def get_block_name(self):
         return 'block%d' % self.block_id
 
     def __enter__(self):
-        if os.environ.get('TRAVIS') == 'true':
-            print('travis_fold:start:%s' % self.get_block_name())
         return self
 
     def __exit__(self, type, value, traceback):
-        if os.environ.get('TRAVIS') == 'true':
-            print('travis_fold:end:%s' % self.get_block_name())
+        pass
+
+
+# pick the implementation once instead of checking on every use
+Fold = _TravisFold if on_travis else _NoopFold
@@ -30,81 +30,277 @@
 from __future__ import print_function
 
 import argparse
+import atexit
+import json
 import os
 import sys
-from github import Github, UnknownObjectException
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+import requests
+import requests.adapters
+from urllib3.util.retry import Retry
 
+try:
+    from .cache_util import get_cache_path, load_json, save_json
+except (ImportError, ValueError):
+    # run as a script
+    from cache_util import get_cache_path, load_json, save_json
+
+GITHUB_API_URL = 'https://api.github.com'
+
+# wait for the rate limit to reset when fewer than this many requests are left
+RATE_LIMIT_THRESHOLD = 50
+
+# seconds to wait for a response to any other request
+REQUEST_TIMEOUT = 15
+
+# seconds to wait for a response to a GraphQL query
+GRAPHQL_TIMEOUT = 60
+
+
+class ExpiringCache(object):
+    """Mapping whose entries are forgotten after ttl seconds."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry[0] >= self.ttl:
+            return default
+        return entry[1]
+
+    def __setitem__(self, key, value):
+        self._entries[key] = (time.time(), value)
+
+
+UNVERIFIED_HOOK_WARNING = (
+    'Warning: Push access detected but unable to verify manual hook '
+    'configuration for repo [ %s ]. Please visit '
+    'http://wiki.ros.org/buildfarm/Pull%%20request%%20testing '
+    'and make sure hooks are setup.')
+
+# results of previous hook lookups keyed by the authenticated user, the repo
+# full name and the callback url, since hooks may only be visible to some users
+detected_hooks = ExpiringCache(120)
+# repositories keyed by the authenticated user and their names
+github_repos = ExpiringCache(120)
+_not_cached = object()
+
+# GitHub API responses and their ETag keyed by url, kept across runs
+response_cache_file = get_cache_path('github_responses.json')
+response_cache = None
+response_cache_lock = threading.Lock()
+
+
+def _get_response_cache():
+    global response_cache
+    if response_cache is None:
+        response_cache = load_json(response_cache_file)
+        # drop full hook listings stored by earlier versions, their urls may contain secrets
+        for url in [url for url, (_, data) in response_cache.items() if isinstance(data, list)]:
+            del response_cache[url]
+        atexit.register(_save_response_cache)
+    return response_cache
+
+
+def _save_response_cache():
+    try:
+        with response_cache_lock:
+            save_json(response_cache_file, response_cache)
+    except (IOError, OSError) as ex:
+        print('Failed to write GitHub response cache [ %s ]: %s' % (response_cache_file, ex), file=sys.stderr)
+
+
+def _wait_for_rate_limit(response, *args, **kwargs):
+    remaining = response.headers.get('X-RateLimit-Remaining')
+    reset = response.headers.get('X-RateLimit-Reset')
+    if remaining is None or reset is None or int(remaining) >= RATE_LIMIT_THRESHOLD:
+        return
+    delay = int(reset) - time.time() + 1
+    if delay > 0:
+        print('Only %s GitHub API requests left, waiting %d seconds for the rate limit '
+              'to reset' % (remaining, delay), file=sys.stderr)
+        time.sleep(delay)
+
+
+def get_json(session, path, extract=None, cache_key=None):
+    """Fetch a GitHub API resource, returning None if it does not exist.
+
+    The request is conditional on the ETag of the previously fetched
+    response, GitHub answers with 304 Not Modified if it did not change,
+    which does not count against the rate limit. Paginated lists are
+    followed through their Link headers and only cached if they fit into a
+    single page. If given, extract is applied to the decoded response
+    before it is returned and cached. The cache_key has to identify any
+    other inputs of extract.
+    """
+    url = GITHUB_API_URL + path
+    key = url if cache_key is None else '%s %s' % (url, cache_key)
+    with response_cache_lock:
+        etag, data = _get_response_cache().get(key, (None, None))
+    headers = {'If-None-Match': etag} if etag else {}
+    response = session.get(url, headers=headers)
+    if response.status_code == 304:
+        return data
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    data = response.json()
+    etag = response.headers.get('ETag')
+    while 'next' in response.links:
+        # the ETag only covers the first page
+        etag = None
+        response = session.get(response.links['next']['url'])
+        response.raise_for_status()
+        data.extend(response.json())
+    if extract is not None:
+        data = extract(data)
+    if etag:
+        with response_cache_lock:
+            _get_response_cache()[key] = [etag, data]
+    return data
+
+
+def _get_repo_fields(repo):
+    return {'full_name': repo['full_name'], 'permissions': repo.get('permissions', {})}
+
+
+def _has_hook_url(cb_url):
+    # only keep whether the callback url is present, the urls of other hooks
+    # may contain secrets and must not end up in the response cache
+    def extract(hooks):
+        return any(hook.get('config', {}).get('url') == cb_url for hook in hooks)
+    return extract
+
+
+def detect_repo_hook(repo, cb_url, session, github_user):
+    key = (github_user, repo['full_name'], cb_url)
+    detected = detected_hooks.get(key)
+    if detected is None:
+        # request the largest page size, most repositories have few hooks
+        detected = get_json(
+            session, '/repos/%s/hooks?per_page=100' % repo['full_name'],
+            extract=_has_hook_url(cb_url), cache_key=cb_url)
+        if detected is None:
+            raise RuntimeError('hooks not found')
+        detected_hooks[key] = detected
+    return detected
 
-def detect_repo_hook(repo, cb_url):
-    for hook in repo.get_hooks():
-        if hook.config.get('url') == cb_url:
-            return True
-    return False
+
+class TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTP adapter applying REQUEST_TIMEOUT to requests without a timeout."""
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = REQUEST_TIMEOUT
+        return super(TimeoutHTTPAdapter, self).send(request, timeout=timeout, **kwargs)
 
 
 class GHPRBHookDetector(object):
     def __init__(self, github_user, github_token, callback_url):
         self.callback_url = callback_url
-        self.gh = Github(github_user, github_token)
+        self.github_user = github_user
+        self.github_token = github_token
+        self.session = requests.Session()
+        self.session.auth = (github_user, github_token)
+        self.session.headers['Accept'] = 'application/vnd.github+json'
+        self.session.hooks['response'].append(_wait_for_rate_limit)
+        # retry throttled and failed requests, honoring Retry-After, time out
+        # stalled connections and keep enough connections alive for the
+        # threads of check_hooks_on_repos
+        retry = Retry(
+            total=3, backoff_factor=2, status_forcelist=[403, 429, 502, 503, 504],
+            raise_on_status=False)
+        self.session.mount('https://', TimeoutHTTPAdapter(
+            pool_connections=10, pool_maxsize=10, max_retries=retry))
 
     def get_repo(self, username, reponame):
+        key = (self.github_user, username, reponame)
+        repo = github_repos.get(key, _not_cached)
+        if repo is not _not_cached:
+            return repo
         try:
-            repo = self.gh.get_user(username).get_repo(reponame)
-        except UnknownObjectException as ex:
+            repo = get_json(
+                self.session, '/repos/%s/%s' % (username, reponame),
+                extract=_get_repo_fields)
+        except requests.RequestException as ex:
             print(
                 'Failed to access repo [ %s/%s ] Reason %s'
                 % (username, reponame, ex),
                 file=sys.stderr
                 )
             return None
+        if repo is None:
+            print(
+                'Failed to access repo [ %s/%s ] Reason: not found'
+                % (username, reponame),
+                file=sys.stderr
+                )
+        # missing repositories are remembered as None as well
+        github_repos[key] = repo
         return repo
 
     def check_repo_for_access(self, repo, errors, strict=False):
-        push_access = repo.permissions.push
-        admin_access = repo.permissions.admin
+        permissions = repo.get('permissions', {})
+        # admin access allows the hooks to be set up, no need to look for them
+        if permissions.get('admin'):
+            return True
+        if not permissions.get('push'):
+            return False
         try:
-            hook_detected = detect_repo_hook(repo, self.callback_url)
-        except UnknownObjectException as ex:
-            errors.append('Unable to check repo [ %s ] for hooks: Error: %s' % (repo.full_name, ex))
+            hook_detected = detect_repo_hook(
+                repo, self.callback_url, self.session, self.github_user)
+        except (RuntimeError, requests.RequestException) as ex:
+            errors.append('Unable to check repo [ %s ] for hooks: Error: %s' % (repo['full_name'], ex))
             hook_detected = False
-        if push_access and hook_detected or admin_access:
+        if hook_detected:
             return True
-        if push_access and not hook_detected:
-            print(
-                'Warning: Push access detected but unable to verify manual hook '
-                'configuration for repo [ %s ]. Please visit ' % repo.full_name +
-                'http://wiki.ros.org/buildfarm/Pull%20request%20testing '
-                'and make sure hooks are setup.',
-                file=sys.stderr)
-            if strict:
-                return False
-            else:
-                errors.append(
-                    'Warning: Push access detected but unable to verify manual hook '
-                    'configuration for repo [ %s ]. Please visit ' % repo.full_name +
-                    'http://wiki.ros.org/buildfarm/Pull%20request%20testing '
-                    'and make sure hooks are setup.')
-                return True
+        msg = UNVERIFIED_HOOK_WARNING % repo['full_name']
+        print(msg, file=sys.stderr)
+        if strict:
+            return False
+        errors.append(msg)
+        return True
+
+
+# detectors keyed by (hook user, token, callback url) to reuse their connections
+detectors = {}
+detectors_lock = threading.Lock()
+
+
+def get_detector(hook_user, token, callback_url):
+    key = (hook_user, token, callback_url)
+    with detectors_lock:
+        if key not in detectors:
+            detectors[key] = GHPRBHookDetector(hook_user, token, callback_url)
+        return detectors[key]
+
+
+def report_access(full_name, hooks_ok):
+    if hooks_ok:
+        print('Passed ghprb_detector check for hooks access'
+              ' for repo [ %s ]' % full_name)
+        return True
+    print('ERROR: Not enough permissions to setup pull request'
+          ' builds for repo [ %s ] ' % full_name +
+          'Please see http://wiki.ros.org/buildfarm/Pull%20request%20testing',
+          file=sys.stderr
+          )
+    return False
 
 
 def check_hooks_on_repo(user, repo, errors, hook_user='ros-pull-request-builder',
-        callback_url='http://build.ros.org/ghprbhook/', token=None, strict=False):
-    ghprb_detector = GHPRBHookDetector(hook_user, token, callback_url)
+        callback_url='http://build.ros.org/ghprbhook/', token=None, strict=False,
+        detector=None):
+    ghprb_detector = detector or get_detector(hook_user, token, callback_url)
     test_repo = ghprb_detector.get_repo(user, repo)
 
     if test_repo:
         hooks_ok = ghprb_detector.check_repo_for_access(test_repo, errors, strict=strict)
-        if hooks_ok:
-            print('Passed ghprb_detector check for hooks access'
-                  ' for repo [ %s ]' % test_repo.full_name)
-            return True
-        else:
-            print('ERROR: Not enough permissions to setup pull request'
-                  ' builds for repo [ %s ] ' % (test_repo.full_name) +
-                  'Please see http://wiki.ros.org/buildfarm/Pull%20request%20testing',
-                  file=sys.stderr
-                  )
-            return False
+        return report_access(test_repo['full_name'], hooks_ok)
     else:
         print(
             'ERROR: No github repository found at %s/%s' % (user, repo),
@@ -113,6 +309,89 @@ def check_hooks_on_repo(user, repo, errors, hook_user='ros-pull-request-builder'
         return False
 
 
+def _bearer_auth(token):
+    def auth(request):
+        request.headers['Authorization'] = 'bearer %s' % token
+        return request
+    return auth
+
+
+def get_repo_permissions(repos, detector, batch_size=100):
+    """Query the token's permissions on many (user, repo) pairs with the GraphQL API.
+
+    Returns a dict mapping each pair to a dict with its viewerPermission
+    (e.g. 'ADMIN', 'WRITE' or 'READ') and viewerCanAdminister. Pairs which
+    could not be resolved are left out.
+    """
+    permissions = {}
+    # the GraphQL API only accepts the token as a bearer token
+    auth = _bearer_auth(detector.github_token)
+    for start in range(0, len(repos), batch_size):
+        batch = repos[start:start + batch_size]
+        # GraphQL string literals share the JSON escaping rules
+        query = 'query {\n%s\n}' % '\n'.join(
+            '  r%d: repository(owner: %s, name: %s) { nameWithOwner viewerPermission viewerCanAdminister }'
+            % (i, json.dumps(user), json.dumps(repo))
+            for i, (user, repo) in enumerate(batch))
+        try:
+            response = detector.session.post(
+                GITHUB_API_URL + '/graphql', json={'query': query},
+                auth=auth, timeout=GRAPHQL_TIMEOUT)
+            response.raise_for_status()
+            data = response.json().get('data') or {}
+        except (requests.RequestException, ValueError) as ex:
+            print('Failed to query repository permissions: %s' % ex, file=sys.stderr)
+            continue
+        for i, user_and_repo in enumerate(batch):
+            result = data.get('r%d' % i)
+            if result and result.get('viewerPermission'):
+                permissions[user_and_repo] = result
+    return permissions
+
+
+def check_hooks_on_repos(repos, hook_user='ros-pull-request-builder',
+        callback_url='http://build.ros.org/ghprbhook/', token=None, strict=False, jobs=10):
+    """Check several (user, repo) pairs concurrently.
+
+    Returns a dict mapping each pair to a tuple of whether the hooks are
+    valid and the errors found for it.
+
+    The permissions of all repositories are fetched with batched GraphQL
+    queries first, which decides most repositories without further
+    requests. Only the hooks of repositories with push but without admin
+    access are listed through the REST API.
+    """
+    repos = sorted(set(repos))
+    # a single session is shared by all threads
+    detector = get_detector(hook_user, token, callback_url)
+    permissions = get_repo_permissions(repos, detector) if token else {}
+
+    def check(user_and_repo):
+        user, repo = user_and_repo
+        errors = []
+        result = permissions.get(user_and_repo)
+        if result is None:
+            hooks_ok = check_hooks_on_repo(
+                user, repo, errors, hook_user, callback_url, token, strict, detector=detector)
+            return hooks_ok, errors
+        full_name = result.get('nameWithOwner') or '%s/%s' % (user, repo)
+        if result.get('viewerCanAdminister') or result['viewerPermission'] == 'ADMIN':
+            return report_access(full_name, True), errors
+        if result['viewerPermission'] not in ('WRITE', 'MAINTAIN'):
+            return report_access(full_name, False), errors
+        test_repo = {'full_name': full_name, 'permissions': {'admin': False, 'push': True}}
+        hooks_ok = detector.check_repo_for_access(test_repo, errors, strict=strict)
+        return report_access(full_name, hooks_ok), errors
+
+    # the checks wait on the GitHub API, so threads are sufficient
+    pool = ThreadPool(jobs)
+    try:
+        return dict(zip(repos, pool.map(check, repos)))
+    finally:
+        pool.close()
+        pool.join()
+
+
 def main():
     """A simple main for testing via command line."""
     parser = argparse.ArgumentParser(
@@ -135,17 +414,16 @@ def main():
             'OAUTH Token with hook and organization read access'
             'required in ROSGHPRB_TOKEN environment variable')
     errors = []
+    detector = GHPRBHookDetector(args.hook_user, password, args.callback_url)
     result = check_hooks_on_repo(
         args.user,
         args.repo,
         errors,
-        args.hook_user,
-        args.callback_url,
-        password)
+        detector=detector)
     if errors:
-        print('Errors detected:', file=sys.stderr)
-    for e in errors:
-        print(e, file=sys.stderr)
+        sys.stderr.write('Errors detected:\n')
+        sys.stderr.writelines(e + '\n' for e in errors)
+        sys.stderr.flush()
     if result:
         return 0
     return 1
@@ -1,24 +1,88 @@
 #!/usr/bin/env python
 
+import hashlib
+import multiprocessing
 import os
+import sys
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
 from scripts.check_rosdep import main as check_rosdep
 
+from .cache_util import get_cache_path, load_json, save_json
 from .fold_block import Fold
 
+# digests of rosdep files which passed the check in a previous run
+cache_file = get_cache_path('rosdep_check_cache.json')
+
+
+def save_cache(cache):
+    try:
+        save_json(cache_file, cache)
+    except (IOError, OSError) as e:
+        print('Failed to write rosdep check cache %s: %s' % (cache_file, e))
+
+
+def get_digest(fname, checker_digest):
+    h = hashlib.sha256(checker_digest.encode('utf-8'))
+    with open(fname, 'rb') as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def check_rosdep_file(fname):
+    # capture the diagnostics so they can be printed under the file they belong to
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        result = check_rosdep(fname)
+        return result, sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
 
 def test():
     files = os.listdir('rosdep')
+    cache = load_json(cache_file)
+    # a changed checker invalidates all previous results
+    with open(os.path.join('scripts', 'check_rosdep.py'), 'rb') as f:
+        checker_digest = hashlib.sha256(f.read()).hexdigest()
 
     with Fold() as fold:
         print("""Running 'scripts/check_rosdep.py' on all '*.yaml' in the 'rosdep' directory.
 If this fails you can run 'scripts/clean_rosdep_yaml.py' to help cleanup.
 """)
 
+        fnames = []
+        digests = {}
         for f in sorted(files):
             fname = os.path.join('rosdep', f)
             if not f.endswith('.yaml'):
                 print("Skipping rosdep check of file %s" % fname)
                 continue
-            print("Checking rosdep file: %s" % fname)
-            assert check_rosdep(fname), fold.get_message()
+            digests[fname] = get_digest(fname, checker_digest)
+            if cache.get(fname) == digests[fname]:
+                print("Skipping unchanged rosdep file: %s" % fname)
+                continue
+            fnames.append(fname)
+
+        # the files are independent of each other, check them in parallel
+        pool = multiprocessing.Pool()
+        try:
+            for fname, (result, output) in zip(fnames, pool.imap(check_rosdep_file, fnames)):
+                print("Checking rosdep file: %s" % fname)
+                sys.stdout.write(output)
+                if not result:
+                    # stop at the first failure
+                    pool.terminate()
+                    save_cache(cache)
+                    assert result, fold.get_message('Failed rosdep file: %s' % fname)
+                cache[fname] = digests[fname]
+        finally:
+            pool.close()
+            pool.join()
+
+        save_cache(cache)
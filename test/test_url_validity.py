@@ -146,7 +146,19 @@ def check_git_remote_exists(url, version, tags_valid=False, commits_valid=False)
     return (False, 'No branch found matching %s' % version)
     
 
-def check_source_repo_entry_for_errors(source, tags_valid=False, commits_valid=False):
+def get_pull_request_repo(source):
+    """Return the GitHub (user, repo) pair of a source entry testing pull requests."""
+    if source['type'] != 'git' or not source.get('test_pull_requests'):
+        return None
+    parsedurl = urlparse(source['url'])
+    if 'github.com' not in parsedurl.netloc:
+        return None
+    user = os.path.dirname(parsedurl.path).lstrip('/')
+    repo, _ = os.path.splitext(os.path.basename(parsedurl.path))
+    return user, repo
+
+
+def check_source_repo_entry_for_errors(source, tags_valid=False, commits_valid=False, hook_results=None):
     errors = []
     if source['type'] != 'git':
         print('Cannot verify remote of type[%s] from line [%s] skipping.'
@@ -164,14 +176,16 @@ def check_source_repo_entry_for_errors(source, tags_valid=False, commits_valid=F
     if test_pr:
         parsedurl = urlparse(source['url'])
         if 'github.com' in parsedurl.netloc:
-            user = os.path.dirname(parsedurl.path).lstrip('/')
-            repo, _ = os.path.splitext(os.path.basename(parsedurl.path))
+            user_and_repo = get_pull_request_repo(source)
             hook_errors = []
             rosghprb_token = os.getenv('ROSGHPRB_TOKEN', None)
             if not rosghprb_token:
                 print('No ROSGHPRB_TOKEN set, continuing without checking hooks')
             else:
-                hooks_valid = hook_permissions.check_hooks_on_repo(user, repo, hook_errors, hook_user='ros-pull-request-builder', callback_url='http://build.ros.org/ghprbhook/', token=rosghprb_token)
+                if hook_results and user_and_repo in hook_results:
+                    hooks_valid, hook_errors = hook_results[user_and_repo]
+                else:
+                    hooks_valid = hook_permissions.check_hooks_on_repo(user_and_repo[0], user_and_repo[1], hook_errors, hook_user='ros-pull-request-builder', callback_url='http://build.ros.org/ghprbhook/', token=rosghprb_token)
                 if not hooks_valid:
                     errors += hook_errors
         else:
@@ -181,7 +195,7 @@ def check_source_repo_entry_for_errors(source, tags_valid=False, commits_valid=F
     return None
 
 
-def check_repo_for_errors(repo):
+def check_repo_for_errors(repo, hook_results=None):
     errors = []
     if 'source' in repo:
         source = repo['source']
@@ -189,12 +203,12 @@ def check_repo_for_errors(repo):
         test_commits = source['test_commits'] if 'test_commits' in source else None
         # Allow tags in source entries if test_commits and test_pull_requests are both explicitly false.
         tags_and_commits_valid = True if test_prs is False and test_commits is False else False
-        source_errors = check_source_repo_entry_for_errors(repo['source'], tags_and_commits_valid, tags_and_commits_valid)
+        source_errors = check_source_repo_entry_for_errors(repo['source'], tags_and_commits_valid, tags_and_commits_valid, hook_results)
         if source_errors:
             errors.append('Could not validate source entry for repo %s with error [[[%s]]]' %
                           (repo['repo'], source_errors))
     if 'doc' in repo:
-        source_errors = check_source_repo_entry_for_errors(repo['doc'], tags_valid=True, commits_valid=True)
+        source_errors = check_source_repo_entry_for_errors(repo['doc'], tags_valid=True, commits_valid=True, hook_results=hook_results)
         if source_errors:
             errors.append('Could not validate doc entry for repo %s with error [[[%s]]]' %
                           (repo['repo'], source_errors))
@@ -307,8 +321,19 @@ def main():
             # print("In file: %s Changed repos are:" % path)
             # pprint.pprint(changed_repos)
 
+            # check the hooks of all changed repositories at once
+            hook_results = None
+            rosghprb_token = os.getenv('ROSGHPRB_TOKEN', None)
+            if rosghprb_token:
+                pull_request_repos = [
+                    get_pull_request_repo(r[key]) for r in changed_repos.values()
+                    for key in ('source', 'doc') if key in r]
+                hook_results = hook_permissions.check_hooks_on_repos(
+                    [p for p in pull_request_repos if p], hook_user='ros-pull-request-builder',
+                    callback_url='http://build.ros.org/ghprbhook/', token=rosghprb_token)
+
             for n, r in changed_repos.items():
-                errors = check_repo_for_errors(r)
+                errors = check_repo_for_errors(r, hook_results)
                 detected_errors.extend(["In file '''%s''': " % path + e
                                         for e in errors])
                 if is_eol_distro: